@@ -4,13 +4,19 @@ Production-Ready Btrfs Persistent USB Creator
 Creates a fully persistent, portable Linux USB with Btrfs snapshots
 Supports cross-computer session persistence and recovery
 """
+import asyncio
+import json
 import os
+import re
+import shlex
 import subprocess
 import sys
 import shutil
 import time
 import stat
 import signal
+import threading
+from functools import lru_cache
 
 # Mount points
 ISO_MOUNT = "/mnt/iso_temp"
@@ -24,7 +30,58 @@ ESP_SIZE_MB = 512
 
 # Timeout for operations
 MOUNT_TIMEOUT = 10
-SYNC_TIMEOUT = 30
+
+# Encoded once at import; written to the USB verbatim
+README_BYTES = ("""
+═══════════════════════════════════════════════════════════
+  BTRFS PERSISTENT USB - PORTABLE LINUX SYSTEM
+═══════════════════════════════════════════════════════════
+
+🎯 WHAT IS THIS?
+This USB contains a fully persistent Debian/Ubuntu system
+that saves all changes, files, and settings automatically.
+
+🚀 HOW TO USE:
+1. Boot from this USB on any computer (UEFI or BIOS)
+2. Select "Live with Persistence" from boot menu
+3. Use normally - all changes are saved automatically
+4. Shut down and take USB with you
+5. Boot on another computer - your session continues!
+
+💾 PARTITION LAYOUT:
+- Partition 1: EFI System (512MB) - UEFI boot
+- Partition 2: Boot (4GB FAT32) - OS files + BIOS boot  
+- Partition 3: Persistence (rest) - Btrfs with snapshots
+
+🌳 BTRFS FEATURES:
+- Automatic compression (zstd) for space saving
+- Snapshot capability for backups
+- Better data integrity
+
+📁 YOUR DATA:
+All changes persist across reboots:
+- Installed packages
+- User files and documents
+- System settings
+- Everything!
+
+💡 TIPS:
+- First boot may take longer (system initialization)
+- Install software normally with apt-get
+- Create snapshots before major changes
+
+⚠️  SAFETY:
+- Don't remove USB while system is running
+- Use "Shut Down" properly before unplugging
+
+═══════════════════════════════════════════════════════════
+""").encode("utf-8")
+
+PERSISTENCE_BYTES = b"/ union\n"
+
+# FAT32 is write-back by default; skip access-time updates so the page
+# cache can coalesce the copy into large flushes at unmount
+BOOT_MOUNT_OPTS = "rw,noatime,nodiratime"
 
 
 class TimeoutError(Exception):
@@ -36,8 +93,16 @@ def timeout_handler(signum, frame):
 
 
 def run_cmd(cmd, check=True, capture=False, ignore_error=False, shell=True, timeout=None):
-    """Run shell command safely with better error handling."""
-    print(f">> {cmd}")
+    """Run shell command safely with better error handling.
+    
+    An argv list is executed directly without going through /bin/sh.
+    """
+    if isinstance(cmd, list):
+        shell = False
+        cmd_str = shlex.join(cmd)
+    else:
+        cmd_str = cmd
+    print(f">> {cmd_str}")
     try:
         if capture:
             result = subprocess.check_output(
@@ -59,15 +124,15 @@ def run_cmd(cmd, check=True, capture=False, ignore_error=False, shell=True, time
             
         return True
     except subprocess.TimeoutExpired:
-        print(f"⚠️  Command timed out: {cmd}")
+        print(f"⚠️  Command timed out: {cmd_str}")
         return None if ignore_error else False
     except subprocess.CalledProcessError as e:
         if ignore_error:
-            print(f"⚠️  Ignored error: {cmd}")
+            print(f"⚠️  Ignored error: {cmd_str}")
             if e.stderr:
                 print(f"   Details: {e.stderr}")
             return None
-        print(f"❌ Command failed: {cmd}")
+        print(f"❌ Command failed: {cmd_str}")
         print(f"💡 Error: {e.stderr if e.stderr else str(e)}")
         return False
     except Exception as e:
@@ -75,6 +140,127 @@ def run_cmd(cmd, check=True, capture=False, ignore_error=False, shell=True, time
         return False
 
 
+def run_cmd_streaming(cmd, timeout=None):
+    """Run a long command, echoing its output as it arrives.
+    
+    Used instead of run_cmd for commands with a lot of progress output,
+    which would otherwise be held in memory until the command exits.
+    """
+    shell = not isinstance(cmd, list)
+    cmd_str = cmd if shell else shlex.join(cmd)
+    print(f">> {cmd_str}")
+    try:
+        proc = subprocess.Popen(
+            cmd, shell=shell,
+            stdout=subprocess.PIPE, stderr=subprocess.STDOUT
+        )
+    except OSError as e:
+        print(f"❌ Unexpected error: {e}")
+        return False
+    
+    # Raw bytes are passed through so '\r' progress redraws (dd, rsync)
+    # update in place instead of each becoming a new line
+    sys.stdout.flush()
+    out = sys.stdout.buffer
+    
+    # Reading blocks until the command exits, so the timeout is enforced
+    # by killing the process from a timer thread
+    timed_out = threading.Event()
+    
+    def _kill():
+        timed_out.set()
+        proc.kill()
+    
+    timer = threading.Timer(timeout, _kill) if timeout else None
+    if timer:
+        timer.start()
+    try:
+        for chunk in iter(lambda: proc.stdout.read1(4096), b""):
+            out.write(chunk)
+            out.flush()
+        returncode = proc.wait()
+    finally:
+        if timer:
+            timer.cancel()
+    
+    if timed_out.is_set():
+        print(f"⚠️  Command timed out: {cmd_str}")
+        return False
+    return returncode == 0
+
+
+def _parallel_run(cmds, timeout=60):
+    """Run independent commands concurrently and wait for all of them."""
+    procs = []
+    for cmd in cmds:
+        print(f">> {shlex.join(cmd)}")
+        try:
+            procs.append(subprocess.Popen(
+                cmd,
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True
+            ))
+        except OSError as e:
+            print(f"❌ Command failed: {shlex.join(cmd)}")
+            print(f"💡 Error: {e}")
+            # Don't leave the already-started commands running unreaped
+            for proc in procs:
+                proc.kill()
+                proc.communicate()
+            return False
+    
+    ok = True
+    for cmd, proc in zip(cmds, procs):
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            print(f"⚠️  Command timed out: {shlex.join(cmd)}")
+            ok = False
+            continue
+        
+        if stdout:
+            print(stdout)
+        if proc.returncode != 0:
+            print(f"❌ Command failed: {shlex.join(cmd)}")
+            if stderr:
+                print(f"💡 Error: {stderr}")
+            ok = False
+    
+    return ok
+
+
+@lru_cache(maxsize=None)
+def _which(tool):
+    """Cached shutil.which lookup."""
+    return shutil.which(tool)
+
+
+def sync_device(device):
+    """Flush the target block device only.
+    
+    fsync on the device node writes back its cache and issues a flush to
+    the device, without stalling on unrelated host filesystems the way
+    sync(1) does.
+    """
+    fd = os.open(device, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _write_bytes(path, data):
+    """Write a pre-encoded blob to path through the raw fd interface."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        view = memoryview(data)
+        while view:
+            view = view[os.write(fd, view):]
+    finally:
+        os.close(fd)
+
+
 def check_root():
     """Verify script is running as root."""
     if os.geteuid() != 0:
@@ -90,28 +276,40 @@ def check_requirements():
         "mkfs.vfat": "dosfstools",
         "mkfs.btrfs": "btrfs-progs",
         "btrfs": "btrfs-progs",
-        "rsync": "rsync",
+        "cp": "coreutils",
         "grub-install": "grub2-common grub-efi-amd64-bin grub-pc-bin",
         "mount": "mount",
         "lsblk": "util-linux",
-        "blockdev": "util-linux",
+        "blkdiscard": "util-linux",
+        "udevadm": "udev",
+        "sgdisk": "gdisk",
     }
     
     missing = []
     missing_packages = []
     for tool, package in required.items():
-        if shutil.which(tool) is None:
+        if _which(tool) is None:
             print(f"⚠️  Missing: {tool} (package: {package})")
             missing.append(tool)
             missing_packages.extend(package.split())
     
+    # Not installed automatically - only used to speed up the ISO copy
+    optional = {
+        "xcp": "xcp (parallel copier)",
+        "pv": "pv (copy progress)",
+    }
+    for tool, description in optional.items():
+        if _which(tool) is None:
+            print(f"ℹ️  Optional: {description} not found")
+    
     if missing:
         print(f"\n📦 Installing missing packages...")
-        packages = ' '.join(set(missing_packages))
-        run_cmd("apt-get update -qq", ignore_error=True, timeout=120)
-        run_cmd(f"apt-get install -y {packages}", timeout=300)
+        packages = sorted(set(missing_packages))
+        run_cmd(["apt-get", "update", "-qq"], ignore_error=True, timeout=120)
+        run_cmd(["apt-get", "install", "-y", *packages], timeout=300)
+        _which.cache_clear()
         
-        if shutil.which("mkfs.btrfs") is None:
+        if _which("mkfs.btrfs") is None:
             print("❌ Failed to install btrfs-progs. Please install manually:")
             print("   sudo apt-get install btrfs-progs")
             sys.exit(1)
@@ -119,28 +317,23 @@ def check_requirements():
         print("✅ All required tools are installed")
 
 
+def _mounted_set():
+    """Return the set of current mount points from /proc/self/mountinfo."""
+    try:
+        with open("/proc/self/mountinfo") as f:
+            # Field 5 is the mount point; the kernel octal-escapes spaces etc.
+            return {
+                re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)),
+                       line.split()[4])
+                for line in f
+            }
+    except OSError:
+        return set()
+
+
 def is_mounted(path):
     """Check if mount point is currently mounted."""
-    try:
-        result = subprocess.run(
-            ["mountpoint", "-q", path],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            timeout=5
-        )
-        return result.returncode == 0
-    except:
-        try:
-            result = subprocess.run(
-                f"mount | grep -q ' {path} '",
-                shell=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=5
-            )
-            return result.returncode == 0
-        except:
-            return False
+    return path in _mounted_set()
 
 
 def force_unmount(path, max_attempts=3):
@@ -154,14 +347,8 @@ def force_unmount(path, max_attempts=3):
         
         print(f"   Unmounting {path} (attempt {attempt + 1}/{max_attempts})")
         
-        # Try to kill processes using the mount
-        if attempt > 0:
-            run_cmd(f"fuser -km {path} 2>/dev/null", check=False, ignore_error=True, timeout=5)
-            time.sleep(0.5)
-        
         # Try normal unmount first
-        result = run_cmd(f"umount {path} 2>/dev/null", check=False, ignore_error=True, timeout=10)
-        time.sleep(0.5)
+        result = run_cmd(["umount", path], check=False, ignore_error=True, timeout=10)
         
         if not is_mounted(path):
             print(f"   ✓ Unmounted {path}")
@@ -170,8 +357,7 @@ def force_unmount(path, max_attempts=3):
         # Try lazy unmount on last attempt
         if attempt == max_attempts - 1:
             print(f"   Using lazy unmount for {path}")
-            run_cmd(f"umount -l {path} 2>/dev/null", check=False, ignore_error=True, timeout=5)
-            time.sleep(1)
+            run_cmd(["umount", "-l", path], check=False, ignore_error=True, timeout=5)
     
     # Final check
     if not is_mounted(path):
@@ -181,6 +367,23 @@ def force_unmount(path, max_attempts=3):
     return False
 
 
+@lru_cache(maxsize=None)
+def _lsblk(device):
+    """Return lsblk's JSON description of device (sizes in bytes)."""
+    output = subprocess.check_output(
+        ["lsblk", "-J", "-b", "-o", "NAME,SIZE,TYPE,MOUNTPOINT,FSTYPE", device],
+        text=True, stderr=subprocess.PIPE, timeout=10
+    )
+    return json.loads(output)["blockdevices"][0]
+
+
+def _lsblk_nodes(node):
+    """Yield an lsblk node and all of its descendants."""
+    yield node
+    for child in node.get("children", []):
+        yield from _lsblk_nodes(child)
+
+
 def unmount_all(device):
     """Safely unmount all device partitions and mount points."""
     print(f"\n🔍 Unmounting all partitions on {device}...\n")
@@ -189,29 +392,28 @@ def unmount_all(device):
     all_mounts = [ISO_MOUNT, USB_BOOT, USB_PERSIST, ESP_MOUNT, 
                   "/mnt/iso", "/mnt/usb", "/mnt/esp"]
     
-    for mount in all_mounts:
-        if os.path.exists(mount):
-            run_cmd(f"fuser -km {mount} 2>/dev/null", check=False, ignore_error=True, timeout=5)
+    mounted = _mounted_set()
+    busy = [m for m in all_mounts if m in mounted]
     
-    time.sleep(1)
+    # One fuser call walks /proc once for all mount points
+    if busy:
+        run_cmd(["fuser", "-km", *busy], check=False, ignore_error=True, timeout=10)
+        time.sleep(1)
     
     # Unmount all our known mount points
-    for mount_point in all_mounts:
-        if os.path.exists(mount_point):
-            force_unmount(mount_point)
+    for mount_point in busy:
+        force_unmount(mount_point)
     
     # Unmount all device partitions
     try:
-        partitions = run_cmd(
-            f"lsblk -ln -o NAME {device} 2>/dev/null | tail -n +2",
-            capture=True, ignore_error=True, timeout=10
-        )
-        if partitions:
-            for part in partitions.split('\n'):
-                if part.strip():
-                    part_path = f"/dev/{part.strip()}"
-                    run_cmd(f"umount -l {part_path} 2>/dev/null", 
-                           check=False, ignore_error=True, timeout=5)
+        # Mount state can change between calls (and across the confirmation
+        # prompt), so always query it fresh here
+        _lsblk.cache_clear()
+        info = _lsblk(device)
+        for part in _lsblk_nodes(info):
+            if part is not info and part.get("mountpoint"):
+                run_cmd(["umount", "-l", f"/dev/{part['name']}"],
+                       check=False, ignore_error=True, timeout=5)
     except:
         pass
     
@@ -219,7 +421,6 @@ def unmount_all(device):
     run_cmd(f"umount -l {device}* 2>/dev/null", check=False, ignore_error=True, timeout=5)
     
     print("✓ Unmount complete\n")
-    time.sleep(1)
 
 
 def prepare_mount_points():
@@ -232,107 +433,154 @@ def prepare_mount_points():
             print(f"⚠️  Could not create {path}: {e}")
 
 
+class MountedPartition:
+    """Keep a partition mounted for the duration of a with-block."""
+    
+    def __init__(self, dev, mount_point, opts=None):
+        self.dev = dev
+        self.mount_point = mount_point
+        self.opts = opts
+    
+    def __enter__(self):
+        prepare_mount_points()
+        force_unmount(self.mount_point)
+        
+        print(f"⚙️  Mounting {self.dev} at {self.mount_point}")
+        cmd = ["mount"]
+        if self.opts:
+            cmd += ["-o", self.opts]
+        if not run_cmd(cmd + [self.dev, self.mount_point], timeout=15):
+            raise Exception(f"Failed to mount {self.dev}")
+        return self.mount_point
+    
+    def __exit__(self, *exc):
+        # Unmounting flushes the dirty pages; no explicit sync needed
+        force_unmount(self.mount_point)
+        return False
+
+
+@lru_cache(maxsize=None)
 def get_partition_names(device):
     """Determine correct partition naming scheme."""
+    return tuple(_partition_path(device, n) for n in (1, 2, 3))
+
+
+def _partition_path(device, number):
+    """Device node for partition number on device."""
     base_name = os.path.basename(device)
     if base_name.startswith(('mmcblk', 'nvme', 'loop')):
-        return f"{device}p1", f"{device}p2", f"{device}p3"
-    else:
-        return f"{device}1", f"{device}2", f"{device}3"
+        return f"{device}p{number}"
+    return f"{device}{number}"
+
+
+def _parted_partitions(path):
+    """Return [(number, start_mib)] for the partition table parted reads on path."""
+    output = run_cmd(["parted", "-s", "-m", path, "unit", "MiB", "print"],
+                     capture=True, ignore_error=True, timeout=15)
+    if not output:
+        return None
+    
+    # Machine-readable output: "BYT;", a disk line, then one
+    # "number:start:end:size:fs:name:flags;" line per partition
+    partitions = []
+    for line in output.splitlines()[2:]:
+        fields = line.rstrip(";").split(":")
+        try:
+            partitions.append((int(fields[0]), float(fields[1].rstrip("MiB"))))
+        except (IndexError, ValueError):
+            continue
+    return partitions
 
 
-def wait_for_partitions(device, timeout=15):
+def wait_for_partitions(device, partitions, timeout=15):
     """Wait for partition devices to appear."""
     print("⏳ Waiting for kernel to recognize new partitions...")
     
-    run_cmd(f"partprobe {device} 2>/dev/null", ignore_error=True, timeout=10)
-    run_cmd(f"blockdev --rereadpt {device} 2>/dev/null", ignore_error=True, timeout=10)
+    run_cmd(["partprobe", device], ignore_error=True, timeout=10)
+    # Returns as soon as udev has processed the events and created the
+    # device nodes, instead of polling on a fixed interval
+    run_cmd(["udevadm", "settle", f"--timeout={timeout}"],
+            ignore_error=True, timeout=timeout + 5)
     
-    part1, part2, part3 = get_partition_names(device)
+    part1, part2, part3 = partitions
     
-    for i in range(timeout):
-        if os.path.exists(part1) and os.path.exists(part2) and os.path.exists(part3):
-            print(f"✅ Partitions detected: {part1}, {part2}, {part3}")
-            time.sleep(2)
-            return True
-        time.sleep(1)
-        if i % 3 == 0:
-            run_cmd(f"partprobe {device} 2>/dev/null", ignore_error=True, timeout=5)
+    if os.path.exists(part1) and os.path.exists(part2) and os.path.exists(part3):
+        print(f"✅ Partitions detected: {part1}, {part2}, {part3}")
+        return True
     
     print("⚠️  Partition detection timeout, continuing anyway...")
     return os.path.exists(part1) and os.path.exists(part2)
 
 
-def create_partitions(device):
+def create_partitions(device, partitions):
     """Create GPT partitions: ESP (512MB) + Boot (4GB FAT32) + Persistence (rest, Btrfs)."""
     print(f"\n💽 Creating partition layout on {device}...\n")
     
     # Wipe existing data
     print("🧹 Wiping existing partition signatures...")
-    run_cmd(f"wipefs -af {device} 2>/dev/null", ignore_error=True, timeout=15)
-    run_cmd(f"dd if=/dev/zero of={device} bs=1M count=10 conv=notrunc 2>/dev/null", 
-           ignore_error=True, timeout=15)
-    time.sleep(2)
-    
-    # Create GPT partition table
-    print("📝 Creating GPT partition table...")
-    run_cmd(f"parted -s {device} mklabel gpt", timeout=20)
-    
-    # Partition 1: EFI System Partition (ESP) - 512MB
-    print("📝 Creating EFI System Partition (512MB)...")
-    run_cmd(f"parted -s -a optimal {device} mkpart primary fat32 1MiB {ESP_SIZE_MB}MiB", timeout=20)
-    run_cmd(f"parted -s {device} set 1 esp on", timeout=10)
-    
-    # Partition 2: Boot partition (FAT32, 4GB)
+    # Discard is a metadata-only operation on flash; not every USB bridge
+    # supports it, so wipefs remains the fallback for stale signatures.
+    discarded = run_cmd(["blkdiscard", "-f", device], ignore_error=True, timeout=30)
+    if not discarded:
+        print("   Discard not supported, falling back to signature wipe")
+    run_cmd(["wipefs", "-af", device], ignore_error=True, timeout=15)
+    run_cmd(["sgdisk", "--zap-all", device], ignore_error=True, timeout=15)
+    
+    # Layout:
+    #   1: EFI System Partition (512MB)
+    #   2: Boot partition (FAT32, 4GB)
+    #   3: Btrfs persistence (remaining space)
+    # All steps go to a single parted run so the GPT (and its backup at the
+    # end of the disk) is rewritten once rather than after every step
     boot_end = ESP_SIZE_MB + (BOOT_SIZE_GB * 1024)
-    print(f"📝 Creating boot partition ({BOOT_SIZE_GB}GB FAT32)...")
-    run_cmd(f"parted -s -a optimal {device} mkpart primary fat32 {ESP_SIZE_MB}MiB {boot_end}MiB", timeout=20)
-    run_cmd(f"parted -s {device} set 2 boot on", timeout=10)
-    
-    # Partition 3: Btrfs persistence
-    print("📝 Creating Btrfs persistence partition (remaining space)...")
-    run_cmd(f"parted -s -a optimal {device} mkpart primary btrfs {boot_end}MiB 100%", timeout=20)
-    
-    if not wait_for_partitions(device):
+    print(f"📝 Creating GPT layout: ESP ({ESP_SIZE_MB}MB), "
+          f"boot ({BOOT_SIZE_GB}GB FAT32), persistence (remaining space)...")
+    run_cmd(["parted", "-s", "-a", "optimal", device,
+             "mklabel", "gpt",
+             "mkpart", "primary", "fat32", "1MiB", f"{ESP_SIZE_MB}MiB",
+             "mkpart", "primary", "fat32", f"{ESP_SIZE_MB}MiB", f"{boot_end}MiB",
+             "mkpart", "primary", "btrfs", f"{boot_end}MiB", "100%",
+             "set", "1", "esp", "on",
+             "set", "2", "boot", "on"], timeout=60)
+    
+    if not wait_for_partitions(device, partitions):
         print("⚠️  Warning: Partitions may not be ready")
+    # The cached layout describes the old partition table
+    _lsblk.cache_clear()
     
-    part1, part2, part3 = get_partition_names(device)
+    part1, part2, part3 = partitions
     
-    # Format partitions
+    # Format partitions - they cover disjoint ranges, so let the device
+    # queue interleave the writes instead of waiting on each mkfs in turn
     print(f"\n💾 Formatting partitions...")
-    
-    print(f"   Formatting {part1} as FAT32 (ESP)...")
-    run_cmd(f"umount {part1} 2>/dev/null", check=False, ignore_error=True, timeout=5)
-    time.sleep(1)
-    run_cmd(f"mkfs.vfat -F 32 -n EFI {part1}", timeout=30)
-    
-    print(f"   Formatting {part2} as FAT32 (BOOT)...")
-    run_cmd(f"umount {part2} 2>/dev/null", check=False, ignore_error=True, timeout=5)
-    time.sleep(1)
-    run_cmd(f"mkfs.vfat -F 32 -n BOOT {part2}", timeout=30)
-    
-    print(f"   Formatting {part3} as Btrfs (PERSISTENCE)...")
-    run_cmd(f"umount {part3} 2>/dev/null", check=False, ignore_error=True, timeout=5)
-    time.sleep(1)
-    run_cmd(f"mkfs.btrfs -f -L persistence -m single -d single {part3}", timeout=60)
+    print(f"   {part1} as FAT32 (ESP), {part2} as FAT32 (BOOT), {part3} as Btrfs (PERSISTENCE)")
+    mkfs_btrfs = ["mkfs.btrfs", "-f", "-L", "persistence", "-m", "single", "-d", "single"]
+    if discarded:
+        # The whole device was already discarded above, so skip
+        # mkfs.btrfs's own discard pass
+        mkfs_btrfs.append("-K")
+    if not _parallel_run([
+        ["mkfs.vfat", "-I", "-F", "32", "-n", "EFI", part1],
+        ["mkfs.vfat", "-I", "-F", "32", "-n", "BOOT", part2],
+        mkfs_btrfs + [part3],
+    ], timeout=60):
+        print("⚠️  Warning: Some partitions may not be formatted")
     
     print("✅ Partitioning complete!\n")
-    time.sleep(2)
 
 
-def setup_btrfs_subvolumes(device):
+def setup_btrfs_subvolumes(partitions):
     """Create Btrfs subvolumes for better snapshot management."""
     print("\n🌳 Setting up Btrfs subvolumes...\n")
     
-    _, _, part3 = get_partition_names(device)
+    _, _, part3 = partitions
     
     prepare_mount_points()
     force_unmount(USB_PERSIST)
-    time.sleep(1)
     
     # Mount Btrfs partition
     print(f"⚙️  Mounting Btrfs partition: {part3}")
-    if not run_cmd(f"mount -o compress=zstd,noatime {part3} {USB_PERSIST}", timeout=15):
+    if not run_cmd(["mount", "-o", "compress=zstd,noatime", part3, USB_PERSIST], timeout=15):
         print("⚠️  Failed to mount Btrfs partition, skipping subvolumes")
         return False
     
@@ -341,7 +589,7 @@ def setup_btrfs_subvolumes(device):
     subvolumes = ["@rootfs", "@home", "@snapshots", "@work"]
     
     for subvol in subvolumes:
-        run_cmd(f"btrfs subvolume create {USB_PERSIST}/{subvol}", 
+        run_cmd(["btrfs", "subvolume", "create", f"{USB_PERSIST}/{subvol}"],
                ignore_error=True, timeout=15)
     
     # Create structure
@@ -358,77 +606,204 @@ def setup_btrfs_subvolumes(device):
     return True
 
 
-def copy_iso_contents(iso_path, device):
-    """Mount ISO and copy its contents to USB boot partition."""
+def _drop_page_cache(path):
+    """Drop the file's cached pages so the ISO doesn't crowd out the host."""
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        # Acts on the file's page cache, not just this descriptor
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+def _is_hybrid_iso(iso_path):
+    """Check whether the ISO also carries an MBR, so it boots when written raw."""
+    try:
+        with open(iso_path, "rb") as f:
+            head = f.read(512)
+            f.seek(0x8001)
+            iso_magic = f.read(5)
+    except OSError:
+        return False
+    return head[510:512] == b"\x55\xAA" and iso_magic == b"CD001"
+
+
+def _has_gpt(device):
+    """Check for a GPT header in LBA 1 (512-byte sectors)."""
+    try:
+        with open(device, "rb") as f:
+            f.seek(512)
+            return f.read(8) == b"EFI PART"
+    except OSError:
+        return False
+
+
+def _iso_end_mib(iso_path):
+    """First whole MiB after the ISO image, where persistence can start."""
+    return -(-os.path.getsize(iso_path) // (1024 * 1024)) + 1
+
+
+def hybrid_preflight(iso_path, device):
+    """Check the raw-write path can finish before anything is written."""
+    # parted must understand the image's partition table, since it has to
+    # append to it once the ISO is on the device
+    if not _which("parted") or not _parted_partitions(iso_path):
+        print("ℹ️  parted cannot read this ISO's partition table; fast write not offered")
+        return False
+    
+    try:
+        device_size = int(_lsblk(device)["size"])
+    except Exception:
+        return False
+    # Leave at least 1 GiB for the persistence partition
+    if device_size < (_iso_end_mib(iso_path) + 1024) * 1024 * 1024:
+        print("ℹ️  Device too small for the ISO plus persistence; fast write not offered")
+        return False
+    return True
+
+
+def write_hybrid_iso(iso_path, device):
+    """Write a hybrid ISO straight to the device, then add persistence."""
+    print("\n⚡ Writing hybrid ISO directly to USB...\n")
+    
+    # Clear the old layout first: an MBR-only image would otherwise leave a
+    # previous run's backup GPT header behind at the end of the disk
+    print("🧹 Wiping existing partition signatures...")
+    run_cmd(["wipefs", "-af", device], ignore_error=True, timeout=15)
+    run_cmd(["sgdisk", "--zap-all", device], ignore_error=True, timeout=15)
+    
+    # One sequential write; the image already contains its bootloaders
+    try:
+        written = run_cmd_streaming(["dd", f"if={iso_path}", f"of={device}", "bs=4M",
+                                     "oflag=direct", "conv=fsync", "status=progress"])
+    finally:
+        _drop_page_cache(iso_path)
+    if not written:
+        print("❌ Failed to write ISO!")
+        return False
+    
+    # The image's GPT (if any) is sized for the ISO; move its backup
+    # header to the real end of the disk so parted accepts the table
+    if _has_gpt(device):
+        run_cmd(["sgdisk", "-e", device], ignore_error=True, timeout=15)
+    
+    iso_end = _iso_end_mib(iso_path)
+    print(f"📝 Creating Btrfs persistence partition after the ISO ({iso_end}MiB)...")
+    if not run_cmd(["parted", "-s", "-a", "optimal", device, "--",
+                    "mkpart", "primary", "btrfs", f"{iso_end}MiB", "100%"], timeout=60):
+        print("❌ Failed to create persistence partition!")
+        return False
+    
+    run_cmd(["partprobe", device], ignore_error=True, timeout=10)
+    run_cmd(["udevadm", "settle", "--timeout=15"], ignore_error=True, timeout=20)
+    _lsblk.cache_clear()
+    
+    # Identify the new partition by its start offset. Guessing wrong here
+    # would format one of the ISO's own partitions, so bail out instead.
+    numbers = [n for n, start in _parted_partitions(device) or []
+               if abs(start - iso_end) < 1]
+    persist_part = _partition_path(device, numbers[0]) if len(numbers) == 1 else None
+    try:
+        known = {f"/dev/{node['name']}" for node in _lsblk_nodes(_lsblk(device))}
+    except Exception:
+        known = set()
+    
+    if persist_part is None or persist_part not in known or not os.path.exists(persist_part):
+        print(f"❌ Could not identify the new partition at {iso_end}MiB; not formatting anything")
+        return False
+    
+    if not run_cmd(["mkfs.btrfs", "-f", "-L", "persistence", "-m", "single", "-d", "single",
+                    persist_part], timeout=60):
+        return False
+    
+    # live-boot looks for persistence.conf on the partition labelled
+    # 'persistence'
+    with MountedPartition(persist_part, USB_PERSIST, "compress=zstd,noatime"):
+        try:
+            _write_bytes(os.path.join(USB_PERSIST, "persistence.conf"), PERSISTENCE_BYTES)
+            print("✅ Created persistence.conf")
+        except Exception as e:
+            print(f"⚠️  Warning: Could not create persistence.conf: {e}")
+    
+    # The ISO filesystem is read-only, so grub.cfg can't be patched
+    print("💡 The ISO's boot menu is unchanged: add 'persistence' to the")
+    print("   kernel command line at boot (press 'e' in GRUB) if needed")
+    
+    print("✅ Hybrid ISO written!")
+    return True
+
+
+def copy_iso_contents(iso_path):
+    """Mount ISO and copy its contents to the mounted USB boot partition."""
     print("\n📀 Copying ISO contents to USB...\n")
     
     prepare_mount_points()
-    _, part2, _ = get_partition_names(device)
     
     # Mount ISO
     print(f"⚙️  Mounting ISO: {iso_path}")
     force_unmount(ISO_MOUNT)
     
-    if not run_cmd(f"mount -o loop,ro {iso_path} {ISO_MOUNT}", timeout=15):
+    if not run_cmd(["mount", "-o", "loop,ro", iso_path, ISO_MOUNT], timeout=15):
         print("❌ Failed to mount ISO!")
         return False
     
-    # Mount USB boot partition
-    print(f"⚙️  Mounting USB boot partition: {part2}")
-    force_unmount(USB_BOOT)
-    time.sleep(1)
-    
-    if not run_cmd(f"mount {part2} {USB_BOOT}", timeout=15):
-        print("❌ Failed to mount USB boot partition!")
-        force_unmount(ISO_MOUNT)
-        return False
-    
     print("\n📋 Copying ISO files (this may take 5-15 minutes)...")
     print("    Progress updates will appear below...\n")
     
-    # Copy with rsync - no timeout as this can take a while
-    rsync_cmd = (
-        "rsync -avh --no-perms --no-owner --no-group "
-        "--modify-window=1 "
-        "--exclude='lost+found' "
-        "--info=progress2 "
-        f"{ISO_MOUNT}/ {USB_BOOT}/ 2>&1"
-    )
-    
-    run_cmd(rsync_cmd, check=False)
-    
-    print("\n⏳ Syncing filesystem (this may take 30 seconds)...")
-    # Don't use run_cmd for sync as it has no output
-    subprocess.run("sync", shell=True, timeout=SYNC_TIMEOUT)
-    print("✓ Sync complete")
-    time.sleep(2)
+    # The target is freshly formatted, so a plain copy is enough - there is
+    # nothing for rsync's delta engine to compare against. No timeout as
+    # this can take a while.
+    if _which("xcp"):
+        # Parallel copier; -T copies into USB_BOOT itself rather than
+        # creating a subdirectory named after the source
+        copy_cmd = ["xcp", "-r", "-T", ISO_MOUNT, USB_BOOT]
+    elif _which("pv"):
+        # pipefail so a failing tar on either side is reported, not just
+        # the last one in the pipeline
+        copy_cmd = ["bash", "-o", "pipefail", "-c", (
+            f"tar cf - -C {ISO_MOUNT} . "
+            # -f keeps pv reporting with stderr piped; -n prints one
+            # percentage per line instead of redrawing a bar
+            f"| pv -f -n -s $(du -sb {ISO_MOUNT} | cut -f1) "
+            f"| tar xf - --no-same-owner --no-same-permissions -C {USB_BOOT}"
+        )]
+    elif _which("cp"):
+        copy_cmd = f"cp -a --no-preserve=ownership,mode {ISO_MOUNT}/. {USB_BOOT}/"
+    else:
+        copy_cmd = (
+            "rsync -avh --no-perms --no-owner --no-group "
+            "--exclude='lost+found' "
+            "--info=progress2 "
+            f"{ISO_MOUNT}/ {USB_BOOT}/"
+        )
     
-    force_unmount(USB_BOOT)
-    force_unmount(ISO_MOUNT)
+    try:
+        copied = run_cmd_streaming(copy_cmd)
+    finally:
+        force_unmount(ISO_MOUNT)
+        _drop_page_cache(iso_path)
     
-    print("✅ ISO contents copied!")
+    # FAT32 can't hold symlinks or permissions, so some per-file errors
+    # are expected; the copy is not treated as fatal, but is flagged
+    if copied:
+        print("✅ ISO contents copied!")
+    else:
+        print("⚠️  Copy reported errors - some ISO files may be missing on the USB")
     return True
 
 
-def configure_persistence(device):
+def configure_persistence():
     """Configure advanced Btrfs-based persistence."""
     print("\n⚙️  Configuring persistence system...\n")
     
-    _, part2, _ = get_partition_names(device)
-    
-    force_unmount(USB_BOOT)
-    time.sleep(1)
-    
-    if not run_cmd(f"mount {part2} {USB_BOOT}", timeout=15):
-        print("❌ Failed to mount boot partition!")
-        return False
-    
     # Create persistence configuration
     print("📝 Creating persistence.conf...")
     persistence_conf = os.path.join(USB_BOOT, "persistence.conf")
     try:
-        with open(persistence_conf, "w") as f:
-            f.write("/ union\n")
+        _write_bytes(persistence_conf, PERSISTENCE_BYTES)
         print(f"✅ Created: {persistence_conf}")
     except Exception as e:
         print(f"⚠️  Warning: Could not create persistence.conf: {e}")
@@ -439,49 +814,37 @@ def configure_persistence(device):
     grub_cfg = os.path.join(USB_BOOT, "boot/grub/grub.cfg")
     if os.path.exists(grub_cfg):
         print("📝 Updating GRUB configuration...")
-        try:
-            with open(grub_cfg, 'r') as f:
-                grub_content = f.read()
-            
-            if 'persistence' not in grub_content:
-                grub_content = grub_content.replace(
-                    'boot=live',
-                    f'boot=live {boot_params}'
-                )
-                with open(grub_cfg, 'w') as f:
-                    f.write(grub_content)
+        # Skip if already configured so reruns don't duplicate parameters
+        already = subprocess.run(
+            ["grep", "-q", "persistence", grub_cfg],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=10
+        ).returncode == 0
+        
+        if not already:
+            if run_cmd(["sed", "-i", f"s|boot=live|boot=live {boot_params}|g", grub_cfg],
+                       ignore_error=True, timeout=10):
                 print("✅ GRUB config updated")
-        except Exception as e:
-            print(f"⚠️  Could not modify GRUB config: {e}")
-    
-    subprocess.run("sync", shell=True, timeout=SYNC_TIMEOUT)
-    time.sleep(1)
-    
-    force_unmount(USB_BOOT)
+            else:
+                print("⚠️  Could not modify GRUB config")
     
     print("✅ Persistence configured!")
     return True
 
 
-def install_bootloader(device):
+def install_bootloader(device, partitions):
     """Install GRUB bootloader for both UEFI and BIOS."""
     print("\n🚀 Installing bootloader...\n")
     
-    part1, part2, _ = get_partition_names(device)
-    
-    force_unmount(USB_BOOT)
-    time.sleep(1)
-    
-    if not run_cmd(f"mount {part2} {USB_BOOT}", timeout=15):
-        print("⚠️  Could not mount boot partition")
-        return False
+    part1, _, _ = partitions
     
     # Install GRUB for BIOS
     print("📀 Installing GRUB for BIOS/Legacy boot...")
-    grub_install_cmd = f"grub-install --target=i386-pc --boot-directory={USB_BOOT}/boot {device}"
-    result = run_cmd(grub_install_cmd, check=False, ignore_error=True, timeout=60)
+    grub_install_cmd = [
+        "grub-install", "--target=i386-pc", f"--boot-directory={USB_BOOT}/boot", device
+    ]
+    bios_ok = run_cmd_streaming(grub_install_cmd, timeout=60)
     
-    if result:
+    if bios_ok:
         print("✅ GRUB installed for BIOS boot")
     else:
         print("⚠️  GRUB BIOS installation had issues (may still work)")
@@ -490,14 +853,21 @@ def install_bootloader(device):
     prepare_mount_points()
     force_unmount(ESP_MOUNT)
     
-    if run_cmd(f"mount {part1} {ESP_MOUNT}", check=False, ignore_error=True, timeout=15):
+    if run_cmd(["mount", part1, ESP_MOUNT], check=False, ignore_error=True, timeout=15):
         print("📀 Installing GRUB for UEFI boot...")
         
-        grub_efi_cmd = (
-            f"grub-install --target=x86_64-efi --efi-directory={ESP_MOUNT} "
-            f"--boot-directory={USB_BOOT}/boot --removable --recheck {device}"
-        )
-        result = run_cmd(grub_efi_cmd, check=False, ignore_error=True, timeout=60)
+        # Fonts and themes are platform-independent and were already copied
+        # into the shared boot directory by the BIOS install above. Locales
+        # can't be skipped the same way: an empty list makes grub-install
+        # clear the locale directory.
+        grub_efi_cmd = [
+            "grub-install", "--target=x86_64-efi", f"--efi-directory={ESP_MOUNT}",
+            f"--boot-directory={USB_BOOT}/boot", "--removable", "--recheck"
+        ]
+        if bios_ok:
+            grub_efi_cmd += ["--fonts=", "--themes="]
+        grub_efi_cmd.append(device)
+        result = run_cmd_streaming(grub_efi_cmd, timeout=60)
         
         if result:
             print("✅ GRUB installed for UEFI boot")
@@ -508,71 +878,18 @@ def install_bootloader(device):
     else:
         print("⚠️  Could not install UEFI bootloader")
     
-    force_unmount(USB_BOOT)
-    
     print("✅ Bootloader installation complete!")
     return True
 
 
-def create_readme(device):
+def create_readme():
     """Create README file with usage instructions."""
-    _, part2, _ = get_partition_names(device)
-    
-    force_unmount(USB_BOOT)
-    
-    if run_cmd(f"mount {part2} {USB_BOOT}", check=False, ignore_error=True, timeout=15):
-        readme_path = os.path.join(USB_BOOT, "README.txt")
-        try:
-            with open(readme_path, "w") as f:
-                f.write("""
-═══════════════════════════════════════════════════════════
-  BTRFS PERSISTENT USB - PORTABLE LINUX SYSTEM
-═══════════════════════════════════════════════════════════
-
-🎯 WHAT IS THIS?
-This USB contains a fully persistent Debian/Ubuntu system
-that saves all changes, files, and settings automatically.
-
-🚀 HOW TO USE:
-1. Boot from this USB on any computer (UEFI or BIOS)
-2. Select "Live with Persistence" from boot menu
-3. Use normally - all changes are saved automatically
-4. Shut down and take USB with you
-5. Boot on another computer - your session continues!
-
-💾 PARTITION LAYOUT:
-- Partition 1: EFI System (512MB) - UEFI boot
-- Partition 2: Boot (4GB FAT32) - OS files + BIOS boot  
-- Partition 3: Persistence (rest) - Btrfs with snapshots
-
-🌳 BTRFS FEATURES:
-- Automatic compression (zstd) for space saving
-- Snapshot capability for backups
-- Better data integrity
-
-📁 YOUR DATA:
-All changes persist across reboots:
-- Installed packages
-- User files and documents
-- System settings
-- Everything!
-
-💡 TIPS:
-- First boot may take longer (system initialization)
-- Install software normally with apt-get
-- Create snapshots before major changes
-
-⚠️  SAFETY:
-- Don't remove USB while system is running
-- Use "Shut Down" properly before unplugging
-
-═══════════════════════════════════════════════════════════
-""")
-            print("✅ Created README.txt")
-        except Exception as e:
-            print(f"⚠️  Could not create README: {e}")
-        
-        force_unmount(USB_BOOT)
+    readme_path = os.path.join(USB_BOOT, "README.txt")
+    try:
+        _write_bytes(readme_path, README_BYTES)
+        print("✅ Created README.txt")
+    except Exception as e:
+        print(f"⚠️  Could not create README: {e}")
 
 
 def validate_device(device):
@@ -592,24 +909,14 @@ def validate_device(device):
     
     # Safety check
     try:
-        lsblk_output = run_cmd(
-            f"lsblk -ln -o NAME,MOUNTPOINT {device}",
-            capture=True,
-            ignore_error=True,
-            timeout=10
-        )
+        critical_mounts = ['/', '/boot', '/boot/efi', '/home', '/usr', '/var']
         
-        if lsblk_output:
-            critical_mounts = ['/', '/boot', '/boot/efi', '/home', '/usr', '/var']
-            
-            for line in lsblk_output.split('\n'):
-                parts = line.split()
-                if len(parts) >= 2:
-                    mountpoint = parts[1]
-                    if mountpoint in critical_mounts:
-                        print(f"❌ Safety check: {device} mounted at {mountpoint}")
-                        print(f"   This is your system disk!")
-                        return False
+        for node in _lsblk_nodes(_lsblk(device)):
+            mountpoint = node.get("mountpoint")
+            if mountpoint in critical_mounts:
+                print(f"❌ Safety check: {device} mounted at {mountpoint}")
+                print(f"   This is your system disk!")
+                return False
     except Exception as e:
         print(f"⚠️  Could not verify device safety: {e}")
     
@@ -640,23 +947,64 @@ def show_device_info(device):
     print("─" * 60)
     
     try:
-        size_bytes = run_cmd(f"blockdev --getsize64 {device}", capture=True, timeout=10)
-        if size_bytes:
-            size_gb = int(size_bytes) / (1024**3)
-            print(f"   Size: {size_gb:.2f} GB")
-    except:
+        info = _lsblk(device)
+        print(f"   Size: {int(info['size']) / (1024**3):.2f} GB")
+        
+        print(f"\n   Current layout:")
+        for node in _lsblk_nodes(info):
+            size_gb = int(node["size"]) / (1024**3)
+            print(f"   {node['name']:<12} {size_gb:>8.2f}G  {node['type']:<5} "
+                  f"{node.get('fstype') or '':<8} {node.get('mountpoint') or ''}")
+    except Exception:
         pass
     
+    print("─" * 60)
+
+
+def _capture(func, *args):
+    """Call func, returning any exception instead of raising it."""
     try:
-        parts = run_cmd(f"lsblk -o NAME,SIZE,TYPE,MOUNTPOINT {device}", 
-                       capture=True, timeout=10)
-        if parts:
-            print(f"\n   Current layout:")
-            print("   " + "\n   ".join(parts.split('\n')))
-    except:
-        pass
+        return func(*args)
+    except BaseException as e:
+        return e
+
+
+async def build_usb(iso_path, device, partitions, hybrid=False):
+    """Run the creation phases, overlapping the ones that are independent."""
+    # Tool installation and releasing the device don't depend on each other
+    # Let both threads finish before acting on a failure from either
+    # (including check_requirements' sys.exit, which asyncio would
+    # otherwise propagate immediately)
+    results = await asyncio.gather(
+        asyncio.to_thread(_capture, check_requirements),
+        asyncio.to_thread(_capture, unmount_all, device),
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
     
-    print("─" * 60)
+    if hybrid:
+        if not write_hybrid_iso(iso_path, device):
+            raise Exception("Failed to write hybrid ISO")
+        return
+    
+    create_partitions(device, partitions)
+    
+    # Only a few seconds of work; run it on its own so its output doesn't
+    # interleave with the copy's progress stream
+    setup_btrfs_subvolumes(partitions)
+    
+    # The boot partition stays mounted across every phase that writes to it
+    with MountedPartition(partitions[1], USB_BOOT, BOOT_MOUNT_OPTS):
+        copied = copy_iso_contents(iso_path)
+        if not copied:
+            raise Exception("Failed to copy ISO")
+        
+        if not configure_persistence():
+            raise Exception("Failed to configure persistence")
+        
+        install_bootloader(device, partitions)
+        create_readme()
 
 
 def main():
@@ -680,6 +1028,7 @@ def main():
         sys.exit(1)
     
     iso_path, device = sys.argv[1], sys.argv[2]
+    partitions = get_partition_names(device)
     
     check_root()
     
@@ -691,6 +1040,14 @@ def main():
     
     show_device_info(device)
     
+    hybrid = False
+    if _is_hybrid_iso(iso_path) and hybrid_preflight(iso_path, device):
+        print("\n⚡ This ISO is hybrid-bootable and can be written to the USB as-is.")
+        print("   Much faster, but keeps the ISO's own boot menu and layout")
+        print("   (no Btrfs subvolumes, no README, 'persistence' must be added at boot).")
+        print("❓ Use fast raw write? [y/N]: ", end="")
+        hybrid = input().strip().lower() in ("y", "yes")
+    
     print(f"\n⚠️  WARNING: This will PERMANENTLY ERASE all data on {device}")
     print(f"\n💾 Target: {device}")
     print(f"📀 Source: {iso_path}")
@@ -705,23 +1062,12 @@ def main():
     print("=" * 70)
     
     try:
-        check_requirements()
-        unmount_all(device)
-        create_partitions(device)
-        setup_btrfs_subvolumes(device)
-        
-        if not copy_iso_contents(iso_path, device):
-            raise Exception("Failed to copy ISO")
-        
-        if not configure_persistence(device):
-            raise Exception("Failed to configure persistence")
-        
-        install_bootloader(device)
-        create_readme(device)
+        asyncio.run(build_usb(iso_path, device, partitions, hybrid))
         
         print("\n🧹 Final cleanup...")
         unmount_all(device)
-        subprocess.run("sync", shell=True, timeout=SYNC_TIMEOUT)
+        print("⏳ Flushing remaining writes to USB...")
+        sync_device(device)
         
         print("\n" + "=" * 70)
         print("  ✅ SUCCESS! Persistent USB Created!")
@@ -729,9 +1075,13 @@ def main():
         print(f"\n📀 Your portable Linux system is ready on {device}")
         print("\n💡 How to use:")
         print("   1. Boot from USB")
-        print("   2. Select 'Live with Persistence'")
+        if hybrid:
+            print("   2. Add 'persistence' to the kernel command line")
+        else:
+            print("   2. Select 'Live with Persistence'")
         print("   3. All changes save automatically")
-        print("\n📖 Check README.txt on USB for details")
+        if not hybrid:
+            print("\n📖 Check README.txt on USB for details")
         print("\n✅ Safe to remove USB now")
         
     except KeyboardInterrupt: